@@ -10,6 +10,8 @@ import numpy as np
 import sys
 import time
 
+from invisible_cloak import open_camera, open_cached_camera, request_mjpeg, scan_cameras
+
 
 def test_camera_availability():
     """Test which camera indices are available on the system."""
@@ -17,23 +19,14 @@ def test_camera_availability():
     available_cameras = []
     
     # Test camera indices 0 through 5
-    for i in range(6):
+    for i, shape, error in scan_cameras(range(6)):
         print(f"Testing camera index {i}...", end=" ")
-        cap = cv2.VideoCapture(i)
-        
-        if cap.isOpened():
-            ret, frame = cap.read()
-            if ret:
-                height, width = frame.shape[:2]
-                print(f"✅ WORKING - Resolution: {width}x{height}")
-                available_cameras.append(i)
-            else:
-                print("❌ Failed to read frame")
+        if shape is not None:
+            height, width = shape[:2]
+            print(f"✅ WORKING - Resolution: {width}x{height}")
+            available_cameras.append(i)
         else:
-            print("❌ Cannot open")
-        
-        cap.release()
-        time.sleep(0.5)  # Small delay between tests
+            print(f"❌ {error}")
     
     return available_cameras
 
@@ -79,13 +72,15 @@ def show_camera_live(camera_id):
     print(f"\n📺 Opening live view for camera {camera_id}")
     print("Press 'q' to close the camera view")
     
-    cap = cv2.VideoCapture(camera_id)
+    cap = open_camera(camera_id)
     
     if not cap.isOpened():
         print(f"❌ Cannot open camera {camera_id}")
         return False
     
-    # Set reasonable resolution
+    # Set compressed format first, then a reasonable resolution
+    if not request_mjpeg(cap):
+        print("⚠️ Camera does not accept MJPEG, using its default format")
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
     
@@ -251,9 +246,15 @@ def main():
             fix_common_issues()
             
         elif choice == '6':
-            available = test_camera_availability()
-            if available:
-                cam_id = available[0]
+            # Try the last camera that worked before scanning every index
+            cam_id, cap = open_cached_camera()
+            if cap is not None:
+                cap.release()
+                print(f"\n📌 Using last working camera {cam_id}")
+            else:
+                available = test_camera_availability()
+                cam_id = available[0] if available else None
+            if cam_id is not None:
                 print(f"\n🚀 Starting Invisible Cloak with camera {cam_id}...")
                 import subprocess
                 subprocess.run([sys.executable, "invisible_cloak.py", "--camera", str(cam_id)])
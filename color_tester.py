@@ -7,7 +7,22 @@ This script helps you understand and test different cloak colors.
 
 import cv2
 import numpy as np
-from invisible_cloak import get_hsv_ranges
+from invisible_cloak import get_hsv_ranges, build_mask, open_camera, request_mjpeg
+
+
+# Approximate BGR appearance of each cloak color, for the sample images
+_BGR_SAMPLES = {
+    "red": (0, 0, 255),
+    "green": (0, 255, 0),
+    "blue": (255, 0, 0),
+    "yellow": (0, 255, 255),
+    "purple": (255, 0, 255),
+    "orange": (0, 165, 255),
+    "cyan": (255, 255, 0),
+    "pink": (203, 192, 255),
+    "white": (255, 255, 255),
+    "black": (0, 0, 0),
+}
 
 
 def create_color_chart():
@@ -15,53 +30,35 @@ def create_color_chart():
     print("🎨 Available Cloak Colors and HSV Ranges:")
     print("=" * 60)
     
-    colors = ['red', 'green', 'blue', 'yellow', 'purple', 'orange', 'cyan', 'pink', 'white', 'black']
-    
-    for color in colors:
+    for color in _BGR_SAMPLES:
         ranges = get_hsv_ranges(color)
         print(f"\n🔴 {color.upper()}:")
         
         for i, (lower, upper) in enumerate(ranges):
             print(f"   Range {i+1}: H({lower[0]}-{upper[0]}) S({lower[1]}-{upper[1]}) V({lower[2]}-{upper[2]})")
         
-        # Create a small sample image of the color
-        sample = np.full((100, 200, 3), 128, dtype=np.uint8)
-        
-        # Convert sample color to show approximate appearance
-        if color == 'red':
-            sample[:, :] = [0, 0, 255]  # BGR
-        elif color == 'green':
-            sample[:, :] = [0, 255, 0]
-        elif color == 'blue':
-            sample[:, :] = [255, 0, 0]
-        elif color == 'yellow':
-            sample[:, :] = [0, 255, 255]
-        elif color == 'purple':
-            sample[:, :] = [255, 0, 255]
-        elif color == 'orange':
-            sample[:, :] = [0, 165, 255]
-        elif color == 'cyan':
-            sample[:, :] = [255, 255, 0]
-        elif color == 'pink':
-            sample[:, :] = [203, 192, 255]
-        elif color == 'white':
-            sample[:, :] = [255, 255, 255]
-        elif color == 'black':
-            sample[:, :] = [0, 0, 0]
+        # Create a small sample image showing the approximate color
+        sample = np.full((100, 200, 3), _BGR_SAMPLES[color], dtype=np.uint8)
         
         cv2.imwrite(f"color_sample_{color}.jpg", sample)
         print(f"   📄 Sample saved as: color_sample_{color}.jpg")
 
 
-def test_color_detection(color, camera_id=0):
-    """Test color detection in real-time for a specific color."""
+def test_color_detection(color, camera_id=0, mask_scale=2):
+    """
+    Test color detection in real-time for a specific color.
+    
+    The mask is detected at 1/mask_scale resolution and upsampled back,
+    the same way the main application does it.
+    """
     print(f"\n🧪 Testing {color.upper()} detection...")
     print("Press 'q' to quit, 's' to save current frame")
     
-    cap = cv2.VideoCapture(camera_id)
+    cap = open_camera(camera_id)
     if not cap.isOpened():
         print(f"❌ Cannot open camera {camera_id}")
         return
+    request_mjpeg(cap)
     
     ranges = get_hsv_ranges(color)
     
@@ -71,18 +68,18 @@ def test_color_detection(color, camera_id=0):
             break
         
         frame = cv2.flip(frame, 1)
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        
-        # Create mask for the color
-        mask = None
-        for (lower, upper) in ranges:
-            color_mask = cv2.inRange(hsv, lower, upper)
-            mask = color_mask if mask is None else (mask | color_mask)
+        height, width = frame.shape[:2]
         
-        # Clean mask
-        kernel = np.ones((3, 3), np.uint8)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=2)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_DILATE, kernel, iterations=1)
+        # Create and clean the mask at reduced resolution; only the small
+        # copy is converted to HSV
+        small = frame
+        if mask_scale > 1:
+            small = cv2.resize(frame, (width // mask_scale, height // mask_scale),
+                               interpolation=cv2.INTER_AREA)
+        hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+        mask = build_mask(hsv, ranges)
+        if mask_scale > 1:
+            mask = cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
         
         # Show results side by side
         result = np.hstack([frame, cv2.cvtColor(mask, cv2.COLOR_GRAY2BGR)])
@@ -96,7 +93,7 @@ def test_color_detection(color, camera_id=0):
                    (frame.shape[1] + 10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
         
         # Show coverage percentage
-        coverage = (np.sum(mask > 0) / mask.size) * 100
+        coverage = cv2.countNonZero(mask) * (100.0 / mask.size)
         cv2.putText(result, f"Coverage: {coverage:.1f}%", 
                    (10, result.shape[0] - 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 0), 1)
         
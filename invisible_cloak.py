@@ -14,11 +14,57 @@ Requirements: opencv-python, numpy
 import cv2
 import numpy as np
 import argparse
-from collections import deque
-
-
-def parse_args():
-    """Parse command-line arguments for the invisible cloak application."""
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+# Last camera that opened and delivered a frame, so later runs can skip discovery
+CAMERA_CACHE = Path.home() / ".invisible_cloak" / "camera.json"
+
+
+def _hsv(h, s, v):
+    """Build a read-only uint8 HSV bound (the bounds are shared by every caller)."""
+    bound = np.array([h, s, v], dtype=np.uint8)
+    bound.setflags(write=False)
+    return bound
+
+
+# HSV (lower, upper) bounds per cloak color, built once at import. uint8 matches
+# the HSV images, so cv2.inRange never has to convert the bounds.
+_COLOR_RANGES = {
+    # Red wraps around HSV hue, so we use TWO ranges and OR the masks.
+    "red": [(_hsv(0, 120, 70), _hsv(10, 255, 255)),
+            (_hsv(170, 120, 70), _hsv(180, 255, 255))],
+    "green": [(_hsv(35, 80, 40), _hsv(85, 255, 255))],
+    # Blue color range
+    "blue": [(_hsv(100, 80, 50), _hsv(130, 255, 255))],
+    # Yellow color range
+    "yellow": [(_hsv(20, 80, 50), _hsv(30, 255, 255))],
+    # Purple/Magenta color range
+    "purple": [(_hsv(140, 80, 50), _hsv(170, 255, 255))],
+    # Orange color range (between red and yellow)
+    "orange": [(_hsv(5, 100, 100), _hsv(20, 255, 255))],
+    # Cyan/Light Blue color range
+    "cyan": [(_hsv(85, 50, 50), _hsv(100, 255, 255))],
+    # Pink/Magenta color range (similar to purple but lighter)
+    "pink": [(_hsv(150, 50, 100), _hsv(170, 255, 255))],
+    # White color range (low saturation, high value)
+    "white": [(_hsv(0, 0, 200), _hsv(179, 30, 255))],
+    # Black color range (low value)
+    "black": [(_hsv(0, 0, 0), _hsv(179, 255, 50))],
+}
+
+# Structuring elements for mask cleanup, built once. Two 3x3 opening
+# iterations equal a single 5x5 opening for rectangular kernels.
+_K3 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+_K5 = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments (sys.argv[1:] unless argv is given)."""
     ap = argparse.ArgumentParser(
         description="Harry Potter Invisible Cloak (OpenCV)",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -36,10 +82,13 @@ HSV Tuning Tips:
         """
     )
     
-    ap.add_argument("--camera", type=int, default=0, 
-                    help="Camera index (default: 0)")
+    ap.add_argument("--camera", type=int, default=None, 
+                    help="Camera index (default: last working camera, else 0)")
     ap.add_argument("--bg-frames", type=int, default=60, 
                     help="Frames to capture background (default: 60)")
+    ap.add_argument("--bg-method", type=str, default="mean", choices=["mean", "median"],
+                    help="Background estimate: running mean, or approximate median "
+                         "that ignores brief movement (default: mean)")
     ap.add_argument("--color", type=str, default="red", 
                     choices=["red", "green", "blue", "yellow", "purple", "orange", "cyan", "pink", "white", "black"], 
                     help="Cloak color to make invisible (default: red)")
@@ -47,7 +96,28 @@ HSV Tuning Tips:
                     help="Camera capture width (default: 640)")
     ap.add_argument("--height", type=int, default=480, 
                     help="Camera capture height (default: 480)")
-    return ap.parse_args()
+    ap.add_argument("--mask-scale", type=int, default=2, choices=[1, 2, 4],
+                    help="Downscale factor for cloak detection; the mask is "
+                         "upsampled back to full resolution (default: 2)")
+    ap.add_argument("--mask-stride", type=int, default=2,
+                    help="Rebuild the cloak mask every N displayed frames and reuse "
+                         "it in between; 1 rebuilds every frame (default: 2)")
+    ap.add_argument("--show-stride", type=int, default=1,
+                    help="Process and display every Nth camera frame; keys are still "
+                         "polled on every frame. Only worth raising when imshow is "
+                         "slow on this machine (default: 1)")
+    ap.add_argument("--numba", action="store_true",
+                    help="Build the mask with the Numba-compiled kernel "
+                         "(scales with CPU cores; requires numba)")
+    ap.add_argument("--cuda", action="store_true",
+                    help="Run masking and compositing on the GPU "
+                         "(requires an OpenCV build with CUDA)")
+    args = ap.parse_args(argv)
+    if args.mask_stride < 1:
+        ap.error("--mask-stride must be at least 1")
+    if args.show_stride < 1:
+        ap.error("--show-stride must be at least 1")
+    return args
 
 
 def get_hsv_ranges(color: str):
@@ -59,7 +129,7 @@ def get_hsv_ranges(color: str):
         color (str): Target color ('red', 'green', 'blue', 'yellow', 'purple', 'orange', 'cyan', 'pink', 'white', 'black')
         
     Returns:
-        list: List of (lower, upper) HSV range tuples
+        list: List of (lower, upper) read-only uint8 HSV range tuples
         
     HSV Tuning Tips:
     - Hue (H): Color tone (0-179 in OpenCV)
@@ -71,109 +141,262 @@ def get_hsv_ranges(color: str):
     - Adjust V range based on lighting conditions
     - Red uses TWO ranges due to hue wraparound at 0/180
     """
-    if color == "red":
-        # Red wraps around HSV hue, so we use TWO ranges and OR the masks.
-        lower1 = np.array([0, 120, 70])
-        upper1 = np.array([10, 255, 255])
-        lower2 = np.array([170, 120, 70])
-        upper2 = np.array([180, 255, 255])
-        return [(lower1, upper1), (lower2, upper2)]
-    
-    elif color == "green":
-        lower = np.array([35, 80, 40])
-        upper = np.array([85, 255, 255])
-        return [(lower, upper)]
-    
-    elif color == "blue":
-        # Blue color range
-        lower = np.array([100, 80, 50])
-        upper = np.array([130, 255, 255])
-        return [(lower, upper)]
-    
-    elif color == "yellow":
-        # Yellow color range
-        lower = np.array([20, 80, 50])
-        upper = np.array([30, 255, 255])
-        return [(lower, upper)]
-    
-    elif color == "purple":
-        # Purple/Magenta color range
-        lower = np.array([140, 80, 50])
-        upper = np.array([170, 255, 255])
-        return [(lower, upper)]
-    
-    elif color == "orange":
-        # Orange color range (between red and yellow)
-        lower = np.array([5, 100, 100])
-        upper = np.array([20, 255, 255])
-        return [(lower, upper)]
-    
-    elif color == "cyan":
-        # Cyan/Light Blue color range
-        lower = np.array([85, 50, 50])
-        upper = np.array([100, 255, 255])
-        return [(lower, upper)]
-    
-    elif color == "pink":
-        # Pink/Magenta color range (similar to purple but lighter)
-        lower = np.array([150, 50, 100])
-        upper = np.array([170, 255, 255])
-        return [(lower, upper)]
-    
-    elif color == "white":
-        # White color range (low saturation, high value)
-        lower = np.array([0, 0, 200])
-        upper = np.array([179, 30, 255])
-        return [(lower, upper)]
-    
-    elif color == "black":
-        # Black color range (low value)
-        lower = np.array([0, 0, 0])
-        upper = np.array([179, 255, 50])
-        return [(lower, upper)]
-    
-    else:
+    ranges = _COLOR_RANGES.get(color)
+    if ranges is None:
         # Default to red if unknown color
         print(f"⚠️ Warning: Unknown color '{color}', defaulting to red")
-        lower1 = np.array([0, 120, 70])
-        upper1 = np.array([10, 255, 255])
-        lower2 = np.array([170, 120, 70])
-        upper2 = np.array([180, 255, 255])
-        return [(lower1, upper1), (lower2, upper2)]
+        ranges = _COLOR_RANGES["red"]
+    return ranges
 
 
-def capture_background(cap, num_frames=60):
+def open_camera(index):
+    """
+    Open a camera, preferring the platform's native capture backend.
+    
+    Args:
+        index (int): Camera index
+        
+    Returns:
+        cv2.VideoCapture: Capture object (check isOpened())
+        
+    V4L2 (Linux) or DirectShow (Windows) is requested explicitly instead of
+    letting OpenCV probe backends (GStreamer first on some Linux builds, the
+    slower-to-open MSMF on Windows); if that fails the default auto-detection
+    is used.
+    """
+    if sys.platform.startswith("linux"):
+        backend = cv2.CAP_V4L2
+    elif sys.platform == "win32":
+        backend = cv2.CAP_DSHOW
+    else:
+        return cv2.VideoCapture(index)
+    cap = cv2.VideoCapture(index, backend)
+    if cap.isOpened():
+        return cap
+    cap.release()
+    return cv2.VideoCapture(index)
+
+
+def probe_camera(index):
+    """
+    Open a camera and try to read one frame.
+    
+    Args:
+        index (int): Camera index
+        
+    Returns:
+        tuple: (index, shape, error); shape is the frame shape and error is
+        None for a working camera, otherwise shape is None and error says why
+    """
+    try:
+        cap = cv2.VideoCapture(index)
+        try:
+            if not cap.isOpened():
+                return index, None, "Cannot open"
+            ret, frame = cap.read()
+            if not ret or frame is None:
+                return index, None, "No frame"
+            return index, frame.shape, None
+        finally:
+            cap.release()
+    except Exception as e:
+        return index, None, f"Error: {e}"
+
+
+def scan_cameras(indices=range(6)):
+    """
+    Probe several camera indices.
+    
+    Args:
+        indices (iterable): Camera indices to try
+        
+    Returns:
+        list: probe_camera() results, in index order
+        
+    Probes are dominated by device-open latency, so they run concurrently.
+    DirectShow/MSMF on Windows are not reliable when opened from several
+    threads at once, so they are probed serially there.
+    """
+    indices = list(indices)
+    if sys.platform == "win32":
+        return [probe_camera(i) for i in indices]
+    with ThreadPoolExecutor(max_workers=len(indices)) as pool:
+        return list(pool.map(probe_camera, indices))
+
+
+def _load_cache():
+    """
+    Read the last-known-good camera settings.
+    
+    Returns:
+        dict or None: Cached settings, or None if the cache is missing,
+        unreadable, incomplete or was written by a different OpenCV version
+    """
+    try:
+        cached = json.loads(CAMERA_CACHE.read_text())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or cached.get("opencv") != cv2.__version__:
+        return None
+    for key in ("index", "backend"):
+        # bool is an int subclass, but never a valid index or backend
+        if type(cached.get(key)) is not int:
+            return None
+    return cached
+
+
+def _save_cache(index, cap):
+    """
+    Remember an opened camera as the one to try first next time.
+    
+    Args:
+        index (int): Camera index
+        cap: Opened OpenCV VideoCapture object
+    """
+    # Only what is needed to reopen the device; format and size are
+    # applied by the caller on every run
+    cached = {
+        "index": index,
+        "backend": int(cap.get(cv2.CAP_PROP_BACKEND)),
+        "opencv": cv2.__version__,
+    }
+    try:
+        CAMERA_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        CAMERA_CACHE.write_text(json.dumps(cached, indent=2))
+    except OSError:
+        pass  # The cache is only a startup shortcut
+
+
+def open_cached_camera():
+    """
+    Reopen the last-known-good camera with its backend, skipping discovery.
+    
+    Returns:
+        tuple: (index, cap) if the cached camera opened and delivered a
+        frame, otherwise (None, None)
+    """
+    cached = _load_cache()
+    if cached is None:
+        return None, None
+    cap = cv2.VideoCapture(cached["index"], cached["backend"])
+    if cap.isOpened() and cap.read()[0]:
+        return cached["index"], cap
+    cap.release()
+    return None, None
+
+
+def request_mjpeg(cap):
+    """
+    Ask the camera to deliver MJPEG instead of raw YUYV frames.
+    
+    Args:
+        cap: OpenCV VideoCapture object
+        
+    Returns:
+        bool: True if the driver accepted MJPEG
+        
+    UVC webcams otherwise tend to default to uncompressed YUYV, which
+    saturates USB bandwidth at 640x480x30; MJPEG is compressed on the camera
+    and decoded by libjpeg-turbo. Call this before setting width/height/FPS,
+    since the available modes depend on the pixel format.
+    """
+    mjpg = cv2.VideoWriter_fourcc(*"MJPG")
+    cap.set(cv2.CAP_PROP_FOURCC, mjpg)
+    return int(cap.get(cv2.CAP_PROP_FOURCC)) == mjpg
+
+
+class _StreamingMedian:
+    """
+    Approximate per-pixel temporal median in constant memory.
+    
+    Every channel value is quantized to one of 16 bins and a uint16 count is
+    kept per bin (HxWx3x16, ~30MB at 640x480), so memory does not grow with
+    the number of frames and nothing is sorted. The result is the centre of
+    the median bin, i.e. accurate to within half a bin (8 levels).
+    """
+
+    BIN_SHIFT = 4
+
+    def __init__(self, shape):
+        num_bins = 256 >> self.BIN_SHIFT
+        size = int(np.prod(shape))
+        self.hist = np.zeros(tuple(shape) + (num_bins,), np.uint16)
+        self.count = 0
+        # Flat index of bin 0 for every pixel/channel, plus reusable scratch
+        self._offsets = np.arange(size, dtype=np.intp) * num_bins
+        self._bins = np.empty(size, np.uint8)
+        self._index = np.empty(size, np.intp)
+
+    def add(self, frame):
+        """Add one frame to the per-pixel histograms."""
+        np.right_shift(frame.reshape(-1), self.BIN_SHIFT, out=self._bins)
+        np.add(self._offsets, self._bins, out=self._index)
+        # Each flat index occurs once per frame, so fancy-index += is exact
+        self.hist.reshape(-1)[self._index] += 1
+        self.count += 1
+
+    def result(self):
+        """Return the median image; the histograms are consumed in the process."""
+        cumulative = np.cumsum(self.hist, axis=-1, dtype=np.uint16, out=self.hist)
+        median_bin = np.argmax(cumulative >= (self.count + 1) // 2, axis=-1)
+        bin_width = 1 << self.BIN_SHIFT
+        return (median_bin * bin_width + bin_width // 2).astype(np.uint8)
+
+
+def capture_background(cap, num_frames=60, frame_step=2, method="mean"):
     """
     Capture a stable background while the scene is empty.
-    Uses median over a small buffer to reduce flicker/noise.
+    Averages the frames in a running float32 accumulator to reduce flicker/noise.
     
     Args:
         cap: OpenCV VideoCapture object
         num_frames (int): Number of frames to capture for background
+        frame_step (int): Keep one of every ``frame_step`` camera frames;
+            the skipped ones are grabbed but never decoded
+        method (str): 'mean' (default) or 'median' for an approximate
+            streaming median that ignores someone briefly crossing the scene
         
     Returns:
-        numpy.ndarray: Median background frame
+        numpy.ndarray: Background frame, unmirrored (camera orientation)
         
-    The deque-based approach provides better memory efficiency
-    and the median calculation reduces noise and movement artifacts.
+    Accumulating in place keeps memory constant in num_frames (one float32
+    frame instead of a stack of every captured frame) and avoids the per-pixel
+    sort a median needs. The scene is empty during capture, so the mean is as
+    good as the median at removing sensor noise; when it may not be, the
+    'median' method uses per-pixel histograms, also constant in num_frames
+    (see _StreamingMedian). Sampling every other frame
+    spreads the same number of samples over a longer window, which
+    decorrelates the noise. Only the on-screen preview is mirrored.
     """
     print(f"\n🎬 Capturing background...")
     print("📍 Please step out of the camera view!")
     print(f"⏱️ Capturing {num_frames} frames...")
     
-    buffer = deque(maxlen=num_frames)
+    acc = None
+    median = None
+    captured = 0
     
     for i in range(num_frames):
-        ret, frame = cap.read()
+        for _ in range(frame_step - 1):
+            cap.grab()
+        ret = cap.grab()
+        if ret:
+            ret, frame = cap.retrieve()
         if not ret:
             raise RuntimeError("Failed to read from camera while capturing background.")
             
-        # Mirror the frame for natural webcam interaction
-        frame = cv2.flip(frame, 1)
-        buffer.append(frame)
+        if method == "median":
+            if median is None:
+                median = _StreamingMedian(frame.shape)
+            median.add(frame)
+        else:
+            if acc is None:
+                acc = np.zeros(frame.shape, np.float32)
+            cv2.accumulate(frame, acc)
+        captured += 1
         
-        # Show progress with visual feedback
-        progress_frame = frame.copy()
+        # Show progress with visual feedback, mirrored for natural webcam interaction
+        progress_frame = cv2.flip(frame, 1)
         cv2.putText(progress_frame, f"Capturing background {i+1}/{num_frames}",
                     (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
         cv2.putText(progress_frame, "Stay out of camera view!", 
@@ -191,13 +414,20 @@ def capture_background(cap, num_frames=60):
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
     
+    if captured == 0:
+        raise RuntimeError("No frames captured for background.")
+    
     print("🔄 Processing background...")
-    median_bg = np.median(np.array(buffer), axis=0).astype(np.uint8)
+    if median is not None:
+        bg = median.result()
+    else:
+        # Scale and round to uint8 in one pass, without a float temporary
+        bg = cv2.convertScaleAbs(acc, alpha=1.0 / captured)
     print("✅ Background captured successfully!")
-    return median_bg
+    return bg
 
 
-def build_mask(hsv, ranges):
+def build_mask(hsv, ranges, mask_out=None, tmp=None):
     """
     Build a binary mask for the cloak color using one or more HSV ranges.
     Then denoise with morphology.
@@ -205,43 +435,287 @@ def build_mask(hsv, ranges):
     Args:
         hsv (numpy.ndarray): HSV image
         ranges (list): List of (lower, upper) HSV range tuples
+        mask_out (numpy.ndarray, optional): Preallocated HxW uint8 buffer for the result
+        tmp (numpy.ndarray, optional): Preallocated HxW uint8 scratch buffer,
+            only used when there is more than one range
         
     Returns:
-        numpy.ndarray: Clean binary mask
+        numpy.ndarray: Clean binary mask (``mask_out`` when given)
         
     Morphological Operations:
     - MORPH_OPEN: Removes small noise (erosion followed by dilation)
     - MORPH_DILATE: Connects small gaps and expands the mask
     """
-    mask_total = None
+    if mask_out is None:
+        mask_out = np.empty(hsv.shape[:2], np.uint8)
     
     # Combine all HSV ranges for the target color
-    for (low, high) in ranges:
-        mask = cv2.inRange(hsv, low, high)
-        mask_total = mask if mask_total is None else (mask_total | mask)
+    (low, high), *other_ranges = ranges
+    cv2.inRange(hsv, low, high, dst=mask_out)
+    for (low, high) in other_ranges:
+        if tmp is None:
+            tmp = np.empty_like(mask_out)
+        cv2.inRange(hsv, low, high, dst=tmp)
+        cv2.bitwise_or(mask_out, tmp, dst=mask_out)
+
+    return clean_mask(mask_out)
 
-    # Morphological operations to clean mask
-    kernel = np.ones((3, 3), np.uint8)
+
+def clean_mask(mask):
+    """
+    Remove speckle noise and grow the mask slightly, in place.
     
-    # Remove noise with opening operation
-    mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_OPEN, kernel, iterations=2)
+    Args:
+        mask (numpy.ndarray or cv2.UMat): Binary mask
+        
+    Returns:
+        The same mask
+    """
+    # Remove noise with opening operation (same as a 3x3 opening twice)
+    cv2.morphologyEx(mask, cv2.MORPH_OPEN, _K5, dst=mask)
     
     # Connect gaps with dilation  
-    mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_DILATE, kernel, iterations=1)
+    cv2.dilate(mask, _K3, dst=mask)
+    
+    return mask
+
+
+def mask_size(width, height, mask_scale):
+    """
+    Size at which the cloak mask is built.
+    
+    The mask is a coarse signal: it is detected at 1/mask_scale resolution
+    and upsampled back to the frame size afterwards.
     
-    return mask_total
+    Returns:
+        tuple: (width, height) for cv2.resize
+    """
+    return (width // mask_scale, height // mask_scale)
 
 
-def main():
+def configure_camera(cap, width, height, fps=None):
+    """
+    Apply the capture settings shared by the GUI and no-GUI apps.
+    
+    Args:
+        cap: OpenCV VideoCapture object
+        width (int): Requested frame width
+        height (int): Requested frame height
+        fps (int, optional): Requested frame rate; driver default when None
+        
+    Returns:
+        bool: True if the camera accepted MJPEG (see request_mjpeg)
+    """
+    # Compressed format first (the available modes depend on it), then size
+    mjpeg = request_mjpeg(cap)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if fps is not None:
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    # Keep the driver queue short so frames are as fresh as possible
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return mjpeg
+
+
+def load_mask_kernel(requested):
+    """
+    Import and warm up the Numba mask kernel, only when it was asked for.
+    
+    Args:
+        requested (bool): Whether --numba was given
+        
+    Returns:
+        module or None: The ``mask_kernel`` module, or None when not requested
+        or numba is not installed
+        
+    Importing numba alone takes a noticeable fraction of a second, so this
+    stays out of module import.
+    """
+    if not requested:
+        return None
+    import mask_kernel
+    if not mask_kernel.NUMBA_AVAILABLE:
+        print("⚠️ Warning: numba is not installed, using the OpenCV mask path")
+        return None
+    print("⚙️ Compiling Numba mask kernel...")
+    mask_kernel.warmup()
+    return mask_kernel
+
+
+class LatestFrameGrabber:
+    """
+    Read frames from a camera on a background thread, keeping only the newest.
+    
+    VideoCapture queues several frames on most backends, so a processing loop
+    that falls behind keeps getting stale frames. The grabber drains the camera
+    continuously into a single replaceable slot, which overlaps capture I/O
+    with processing and always hands out the most recent frame.
+    
+    Args:
+        cap: OpenCV VideoCapture object, owned by the grabber until stop()
+    """
+
+    def __init__(self, cap):
+        self.cap = cap
+        self._lock = threading.Lock()
+        self._new = threading.Event()
+        self._ok = True
+        self._frame = None
+        self._stop = False
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop:
+            ok, frame = self.cap.read()
+            with self._lock:
+                self._ok, self._frame = ok, frame
+                self._new.set()
+            if not ok:
+                break
+
+    def read(self):
+        """
+        Return the newest frame that has not been handed out yet.
+        
+        Waits for as long as the capture thread is alive, so a camera that
+        stalls briefly (USB hiccup, long exposure) does not end the session.
+            
+        Returns:
+            tuple: (ret, frame) like VideoCapture.read(); ret is False once
+            the camera has stopped delivering frames
+        """
+        while not self._new.wait(1.0):
+            if not self._thread.is_alive():
+                return False, None
+        with self._lock:
+            ok, frame = self._ok, self._frame
+            self._new.clear()
+        return ok, frame
+
+    def stop(self, timeout=1.0):
+        """
+        Stop the capture thread and wait for it to exit.
+        
+        Args:
+            timeout (float): Seconds to wait; a read stuck in the driver is
+                abandoned (the thread is a daemon)
+        """
+        self._stop = True
+        self._thread.join(timeout)
+
+
+class CudaCloakPipeline:
+    """
+    Run the mask and compositing steps on an NVIDIA GPU through cv2.cuda.
+    
+    The background stays resident on the device and every intermediate is a
+    preallocated GpuMat, so each frame costs one upload and one download.
+    All work is queued on a single cv2.cuda_Stream. Requires an OpenCV build
+    with CUDA support (the PyPI opencv-python wheels have none).
+    
+    Args:
+        bg (numpy.ndarray): Background frame
+        ranges (list): List of (lower, upper) HSV range tuples
+        mask_scale (int): Downscale factor for cloak detection
+    """
+
+    def __init__(self, bg, ranges, mask_scale):
+        height, width = bg.shape[:2]
+        self.size = (width, height)
+        self.small_size = (width // mask_scale, height // mask_scale)
+        self.mask_scale = mask_scale
+        self.ranges = [(tuple(map(float, low)), tuple(map(float, high))) for low, high in ranges]
+        self.stream = cv2.cuda_Stream()
+        
+        small_w, small_h = self.small_size
+        self.g_bg = cv2.cuda_GpuMat()
+        self.g_frame = cv2.cuda_GpuMat(height, width, cv2.CV_8UC3)
+        self.g_small_bgr = cv2.cuda_GpuMat(small_h, small_w, cv2.CV_8UC3)
+        self.g_hsv = cv2.cuda_GpuMat(small_h, small_w, cv2.CV_8UC3)
+        self.g_small_mask = cv2.cuda_GpuMat(small_h, small_w, cv2.CV_8UC1)
+        self.g_mask_tmp = cv2.cuda_GpuMat(small_h, small_w, cv2.CV_8UC1)
+        self.g_mask = cv2.cuda_GpuMat(height, width, cv2.CV_8UC1)
+        self.g_final = cv2.cuda_GpuMat(height, width, cv2.CV_8UC3)
+        
+        self.opener = cv2.cuda.createMorphologyFilter(cv2.MORPH_OPEN, cv2.CV_8UC1, _K5)
+        self.dilater = cv2.cuda.createMorphologyFilter(cv2.MORPH_DILATE, cv2.CV_8UC1, _K3)
+        self.set_background(bg)
+
+    @staticmethod
+    def available():
+        """Return True when OpenCV was built with CUDA and a device is present."""
+        try:
+            return cv2.cuda.getCudaEnabledDeviceCount() > 0
+        except (AttributeError, cv2.error):
+            return False
+
+    def set_background(self, bg):
+        """Upload a new background frame to the device."""
+        self.g_bg.upload(bg, self.stream)
+
+    def process(self, frame, final, update_mask=True):
+        """
+        Build the cloak mask for ``frame`` and composite it into ``final``.
+        
+        Args:
+            frame (numpy.ndarray): Current BGR frame
+            final (numpy.ndarray): Preallocated output buffer
+            update_mask (bool): Rebuild the mask; False reuses the previous one
+        """
+        stream = self.stream
+        self.g_frame.upload(frame, stream)
+        if update_mask:
+            self._build_mask()
+        
+        # Frame everywhere, background where the cloak is
+        self.g_frame.copyTo(stream, self.g_final)
+        self.g_bg.copyTo(self.g_mask, stream, self.g_final)
+        self.g_final.download(stream, final)
+        stream.waitForCompletion()
+
+    def _build_mask(self):
+        """Queue the mask steps for the uploaded frame into g_mask."""
+        stream = self.stream
+        g_bgr = self.g_frame
+        if self.mask_scale > 1:
+            cv2.cuda.resize(g_bgr, self.small_size, dst=self.g_small_bgr,
+                            interpolation=cv2.INTER_AREA, stream=stream)
+            g_bgr = self.g_small_bgr
+        g_hsv = self.g_hsv
+        cv2.cuda.cvtColor(g_bgr, cv2.COLOR_BGR2HSV, dst=g_hsv, stream=stream)
+        
+        g_small_mask = self.g_small_mask if self.mask_scale > 1 else self.g_mask
+        (low, high), *other_ranges = self.ranges
+        cv2.cuda.inRange(g_hsv, low, high, dst=g_small_mask, stream=stream)
+        for (low, high) in other_ranges:
+            cv2.cuda.inRange(g_hsv, low, high, dst=self.g_mask_tmp, stream=stream)
+            cv2.cuda.bitwise_or(g_small_mask, self.g_mask_tmp, dst=g_small_mask, stream=stream)
+        self.opener.apply(g_small_mask, self.g_mask_tmp, stream=stream)
+        self.dilater.apply(self.g_mask_tmp, g_small_mask, stream=stream)
+        if self.mask_scale > 1:
+            cv2.cuda.resize(g_small_mask, self.size, dst=self.g_mask,
+                            interpolation=cv2.INTER_NEAREST, stream=stream)
+
+    def coverage(self):
+        """Return the percentage of the last mask covered by the cloak."""
+        return cv2.cuda.countNonZero(self.g_mask) * (100.0 / (self.size[0] * self.size[1]))
+
+
+def main(argv=None):
     """
     Main function to run the Invisible Cloak application.
     
+    Args:
+        argv (list, optional): Command-line arguments; defaults to sys.argv[1:].
+            Lets launcher scripts run the app in-process.
+    
     Workflow:
     1. Parse command-line arguments
     2. Initialize camera with specified settings
-    3. Capture background frames using median filtering
+    3. Capture background frames using a running mean
     4. Real-time processing loop:
-       - Capture frame and convert to HSV
+       - Take the newest frame from the capture thread and convert to HSV
        - Create mask for cloak color
        - Apply invisible cloak effect
        - Display result with UI elements
@@ -251,82 +725,164 @@ def main():
     print("🧙‍♂️ Harry Potter Invisible Cloak Effect")
     print("=" * 60)
     
-    args = parse_args()
-
-    # Initialize camera with specified settings
-    cap = cv2.VideoCapture(args.camera)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, args.width)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, args.height)
-    cap.set(cv2.CAP_PROP_FPS, 30)
+    args = parse_args(argv)
+
+    # Initialize camera with specified settings. Without --camera the last
+    # working camera is tried first, then index 0.
+    camera, cap = args.camera, None
+    if camera is None:
+        camera, cap = open_cached_camera()
+    from_cache = cap is not None
+    if not from_cache:
+        camera = 0 if camera is None else camera
+        cap = open_camera(camera)
+    mjpeg = configure_camera(cap, args.width, args.height, fps=30)
 
     if not cap.isOpened():
-        raise RuntimeError(f"Could not open camera {args.camera}. Try a different --camera index.")
+        raise RuntimeError(f"Could not open camera {camera}. Try a different --camera index.")
 
-    print(f"📹 Camera {args.camera} initialized: {args.width}x{args.height}")
+    print(f"📹 Camera {camera} initialized: {args.width}x{args.height} "
+          f"({'MJPEG' if mjpeg else 'driver default format'})")
     print(f"🎨 Cloak color: {args.color.upper()}")
     print(f"📊 Background frames: {args.bg_frames}")
 
+    mask_kernel = load_mask_kernel(args.numba)
+    use_numba = mask_kernel is not None
+
+    use_cuda = args.cuda and CudaCloakPipeline.available()
+    if args.cuda and not use_cuda:
+        print("⚠️ Warning: no CUDA device available to OpenCV, using the CPU path")
+
     cv2.namedWindow("Invisible Cloak", cv2.WINDOW_AUTOSIZE)
+    grabber = None
 
     try:
         # Step 1: Capture background with empty scene
-        bg = capture_background(cap, num_frames=args.bg_frames)
+        bg = capture_background(cap, num_frames=args.bg_frames, method=args.bg_method)
+        # The camera has now delivered frames, so it is safe to remember
+        if not from_cache:
+            _save_cache(camera, cap)
 
         # HSV ranges for selected color
         ranges = get_hsv_ranges(args.color)
+        if use_numba:
+            lows, highs = mask_kernel.pack_ranges(ranges)
 
         print(f"\n🎭 Ready! Wear the {args.color} cloak and step into the frame.")
         print("⌨️ Press 'q' to quit, 'r' to recapture background")
         
+        # Preallocate every per-frame image once; OpenCV writes into them via dst=
+        height, width = bg.shape[:2]
+        small_size = mask_size(width, height, args.mask_scale)
+        mask = np.empty((height, width), np.uint8)
+        if args.mask_scale > 1:
+            small_bgr = np.empty((small_size[1], small_size[0], 3), np.uint8)
+            small_mask = np.empty((small_size[1], small_size[0]), np.uint8)
+        else:
+            small_bgr, small_mask = None, mask
+        small_hsv = np.empty((small_size[1], small_size[0], 3), np.uint8)
+        mask_tmp = np.empty_like(small_mask)
+        final = np.empty_like(bg)
+        
+        # Static UI text is rendered once and added onto each frame
+        # (white text saturates to white, black overlay pixels are a no-op)
+        overlay = np.zeros_like(bg)
+        cv2.putText(overlay, f"Harry Potter Invisible Cloak", 
+                    (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(overlay, f"Cloak: {args.color.upper()} | Press 'q' to quit, 'r' to reset",
+                    (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        cv2.putText(overlay, f"FPS: ~30 | Resolution: {args.width}x{args.height}", 
+                    (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+        frame_count = 0
+        shown_count = 0
+        mask_coverage = 0.0
+        
+        gpu = CudaCloakPipeline(bg, ranges, args.mask_scale) if use_cuda else None
+        
+        # Capture runs on its own thread from here on
+        grabber = LatestFrameGrabber(cap)
+        
         while True:
-            ret, frame = cap.read()
+            ret, frame = grabber.read()
             if not ret:
                 print("❌ Failed to read frame from camera")
                 break
 
-            # Mirror the frame for a natural webcam feel
-            frame = cv2.flip(frame, 1)
-
-            # Convert to HSV for robust color segmentation
-            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-            # Step 2: Create color mask for the cloak
-            mask = build_mask(hsv, ranges)
-
-            # Step 3: Invert mask to keep non-cloak regions
-            mask_inv = cv2.bitwise_not(mask)
-
-            # Step 4: Extract background where cloak is present
-            cloak_area = cv2.bitwise_and(bg, bg, mask=mask)
-
-            # Step 5: Extract current frame where cloak is NOT present
-            rest_of_frame = cv2.bitwise_and(frame, frame, mask=mask_inv)
-
-            # Step 6: Combine both parts
-            final = cv2.addWeighted(cloak_area, 1, rest_of_frame, 1, 0)
-
-            # Add UI elements for better user experience
-            cv2.putText(final, f"Harry Potter Invisible Cloak", 
-                        (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.putText(final, f"Cloak: {args.color.upper()} | Press 'q' to quit, 'r' to reset",
-                        (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            
-            # Show cloak coverage percentage
-            mask_coverage = (np.sum(mask > 0) / mask.size) * 100
-            cv2.putText(final, f"Cloak Coverage: {mask_coverage:.1f}%", 
-                        (10, final.shape[0] - 40), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            cv2.putText(final, f"FPS: ~30 | Resolution: {args.width}x{args.height}", 
-                        (10, final.shape[0] - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
-
-            cv2.imshow("Invisible Cloak", final)
+            # Where imshow + waitKey is slow, --show-stride processes and
+            # displays only every Nth frame; frames in between are just read,
+            # with pollKey keeping the keys live. Skipping does not buy time
+            # for the shown frames (the grabber already drops stale ones), so
+            # it defaults to showing every frame.
+            show = frame_count % args.show_stride == 0
+            frame_count += 1
+            if not show:
+                key = cv2.pollKey() & 0xFF
+            else:
+                # Frames are processed unmirrored (masking doesn't care about
+                # orientation); only the displayed result is flipped below.
+
+                # The mask changes little between consecutive displayed frames,
+                # so it is only rebuilt every --mask-stride of them and reused
+                # in between
+                update_mask = shown_count % args.mask_stride == 0
+
+                if gpu is not None:
+                    gpu.process(frame, final, update_mask=update_mask)
+                else:
+                    if update_mask:
+                        # Convert to HSV for robust color segmentation. Only the
+                        # mask needs HSV, so shrink the BGR frame first and convert
+                        # the small copy (averaging BGR is safe, unlike averaging hue).
+                        if args.mask_scale > 1:
+                            cv2.resize(frame, small_size, dst=small_bgr, interpolation=cv2.INTER_AREA)
+                            cv2.cvtColor(small_bgr, cv2.COLOR_BGR2HSV, dst=small_hsv)
+                        else:
+                            cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=small_hsv)
+
+                        # Step 2: Create color mask for the cloak
+                        if use_numba:
+                            mask_kernel.build_mask_fused(small_hsv, lows, highs, out=small_mask, tmp=mask_tmp)
+                        else:
+                            build_mask(small_hsv, ranges, mask_out=small_mask, tmp=mask_tmp)
+                        if args.mask_scale > 1:
+                            cv2.resize(small_mask, (width, height), dst=mask, interpolation=cv2.INTER_NEAREST)
+
+                    # Step 3: Start from the current frame, then copy the background
+                    # over the cloak pixels only (copyTo leaves the rest untouched)
+                    np.copyto(final, frame)
+                    cv2.copyTo(bg, mask, final)
+
+                # Show cloak coverage percentage, refreshed every 10 displayed frames
+                if shown_count % 10 == 0:
+                    if gpu is not None:
+                        mask_coverage = gpu.coverage()
+                    else:
+                        mask_coverage = cv2.countNonZero(mask) * (100.0 / mask.size)
+
+                shown_count += 1
+
+                # Mirror the result for a natural webcam feel, in place
+                cv2.flip(final, 1, dst=final)
+
+                # Add UI elements for better user experience
+                cv2.add(final, overlay, dst=final)
+                cv2.putText(final, f"Cloak Coverage: {mask_coverage:.1f}%", 
+                            (10, height - 40), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+                cv2.imshow("Invisible Cloak", final)
+
+                key = cv2.waitKey(1) & 0xFF
 
             # Handle keyboard input
-            key = cv2.waitKey(1) & 0xFF
             if key == ord('q') or key == 27:  # 'q' or ESC
                 break
             elif key == ord('r'):  # Recapture background
                 print("\n🔄 Recapturing background...")
-                bg = capture_background(cap, num_frames=args.bg_frames)
+                grabber.stop()
+                bg = capture_background(cap, num_frames=args.bg_frames, method=args.bg_method)
+                if gpu is not None:
+                    gpu.set_background(bg)
+                grabber = LatestFrameGrabber(cap)
 
     except KeyboardInterrupt:
         print("\n⏹️ Application interrupted by user")
@@ -334,6 +890,8 @@ def main():
         print(f"\n❌ Error: {e}")
     finally:
         # Cleanup resources
+        if grabber is not None:
+            grabber.stop()
         cap.release()
         cv2.destroyAllWindows()
         print("🧹 Resources cleaned up successfully")
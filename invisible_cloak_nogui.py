@@ -9,10 +9,21 @@ Useful when GUI support is not available.
 import cv2
 import numpy as np
 import argparse
-from collections import deque
 import os
+import queue
+import threading
 import time
 
+from invisible_cloak import (
+    clean_mask, configure_camera, get_hsv_ranges, load_mask_kernel, mask_size,
+    open_camera,
+)
+
+
+# Source rows a mask row depends on, either side: the 5x5 opening erodes and
+# dilates by 2 rows and the 3x3 dilation adds 1 more
+_TILE_HALO = 5
+
 
 def parse_args():
     """Parse command-line arguments for the invisible cloak application."""
@@ -21,28 +32,59 @@ def parse_args():
     ap.add_argument("--camera", type=int, default=0, help="Camera index (default: 0)")
     ap.add_argument("--bg-frames", type=int, default=30, help="Frames to capture background (default: 30)")
     ap.add_argument("--color", type=str, default="red", choices=["red", "green"], help="Cloak color (default: red)")
+    ap.add_argument("--colorspace", type=str, default="bgr", choices=["bgr", "hsv"],
+                    help="Detect the cloak with BGR boxes (no HSV conversion, approximate) "
+                         "or the exact HSV ranges (default: bgr)")
+    ap.add_argument("--mask-scale", type=int, default=2, choices=[1, 2, 4],
+                    help="Detect the cloak at 1/N resolution and upsample the mask (default: 2)")
+    ap.add_argument("--batch-size", type=int, default=8,
+                    help="Frames captured back to back and color-tested together (default: 8)")
+    ap.add_argument("--tile-rows", type=int, default=0,
+                    help="Build the mask in strips of N rows to keep data in cache "
+                         "(CPU paths only; default: 0, whole frame)")
+    ap.add_argument("--numba", action="store_true",
+                    help="Build the mask with the Numba-compiled kernel "
+                         "(scales with CPU cores; requires numba)")
+    ap.add_argument("--use-opencl", action="store_true",
+                    help="Run the per-frame pipeline on cv2.UMat (OpenCL T-API) if available")
+    ap.add_argument("--jpeg-quality", type=int, default=80,
+                    help="JPEG quality of the saved frames, 0-100 (default: 80)")
     ap.add_argument("--output-dir", type=str, default="output", help="Directory to save output frames")
     ap.add_argument("--demo-frames", type=int, default=50, help="Number of demo frames to capture")
     
-    return ap.parse_args()
+    args = ap.parse_args()
+    if args.tile_rows < 0:
+        ap.error("--tile-rows must not be negative")
+    if args.batch_size < 1:
+        ap.error("--batch-size must be at least 1")
+    if not 0 <= args.jpeg_quality <= 100:
+        ap.error("--jpeg-quality must be between 0 and 100")
+    return args
 
 
-def get_hsv_ranges(color: str):
-    """Returns HSV lower/upper bounds for the target cloak color."""
+def get_bgr_ranges(color: str):
+    """
+    Returns BGR lower/upper bounds approximating get_hsv_ranges(color).
+    
+    The boxes were fitted to the HSV ranges (best overlap over the whole BGR
+    cube), so the mask can be built straight from the camera frame without
+    an HSV conversion. They are coarser than the HSV cones; use
+    --colorspace hsv when detection matters more than speed.
+    """
     if color == "red":
-        lower1 = np.array([0, 120, 70])
-        upper1 = np.array([10, 255, 255])
-        lower2 = np.array([170, 120, 70])
-        upper2 = np.array([180, 255, 255])
-        return [(lower1, upper1), (lower2, upper2)]
+        return [(np.array([0, 0, 120]), np.array([100, 100, 255]))]
     else:  # green
-        lower = np.array([35, 80, 40])
-        upper = np.array([85, 255, 255])
-        return [(lower, upper)]
+        return [(np.array([0, 130, 0]), np.array([180, 255, 180]))]
 
 
 def capture_background_nogui(cap, num_frames=30):
-    """Capture background without GUI display."""
+    """
+    Capture background without GUI display.
+    
+    Frames are averaged in a running float32 accumulator, so memory stays at
+    one frame regardless of num_frames and no per-pixel sort is needed (the
+    scene is empty, so the mean removes sensor noise as well as a median).
+    """
     print(f"📷 Capturing {num_frames} background frames...")
     print("🚶 Please step out of camera view for 5 seconds!")
     
@@ -51,7 +93,7 @@ def capture_background_nogui(cap, num_frames=30):
         print(f"⏰ Starting in {i} seconds...")
         time.sleep(1)
     
-    buffer = deque(maxlen=num_frames)
+    acc = None
     
     for i in range(num_frames):
         ret, frame = cap.read()
@@ -59,30 +101,128 @@ def capture_background_nogui(cap, num_frames=30):
             raise RuntimeError("Failed to read from camera")
             
         frame = cv2.flip(frame, 1)  # Mirror
-        buffer.append(frame)
+        if acc is None:
+            acc = np.zeros(frame.shape, np.float32)
+        cv2.accumulate(frame, acc)
         
         if (i + 1) % 10 == 0:
             print(f"📊 Captured {i+1}/{num_frames} frames")
     
     print("🔄 Processing background...")
-    median_bg = np.median(np.array(buffer), axis=0).astype(np.uint8)
+    # Scale and round to uint8 in one pass, without a float temporary
+    mean_bg = cv2.convertScaleAbs(acc, alpha=1.0 / num_frames)
+    
+    return mean_bg
+
+
+def range_mask(hsv, ranges, mask_out=None, tmp=None):
+    """
+    Test every pixel against the color ranges, without any cleanup.
     
-    return median_bg
+    Purely per-pixel, so it can run on several frames stacked into one image.
+    Arguments are as for build_mask().
+    """
+    (low, high), *other_ranges = ranges
+    mask_out = cv2.inRange(hsv, low, high, dst=mask_out)
+    for (low, high) in other_ranges:
+        tmp = cv2.inRange(hsv, low, high, dst=tmp)
+        cv2.bitwise_or(mask_out, tmp, dst=mask_out)
+    return mask_out
 
 
-def build_mask(hsv, ranges):
-    """Build a binary mask for the cloak color."""
-    mask_total = None
-    for (low, high) in ranges:
-        mask = cv2.inRange(hsv, low, high)
-        mask_total = mask if mask_total is None else (mask_total | mask)
+def build_mask(hsv, ranges, mask_out=None, tmp=None):
+    """
+    Build a binary mask for the cloak color from an HSV image, or from a BGR
+    frame when given BGR ranges.
+    
+    mask_out and tmp are optional preallocated HxW uint8 buffers; when given,
+    every step writes into them, otherwise OpenCV allocates them. The image
+    may also be a cv2.UMat, in which case the mask is a UMat too.
+    """
+    mask_out = range_mask(hsv, ranges, mask_out=mask_out, tmp=tmp)
+    return clean_mask(mask_out)
+
+
+class TiledMaskBuilder:
+    """
+    Build the cloak mask in horizontal strips small enough to stay in cache.
+    
+    Each strip is converted (optionally to HSV) and masked on its own, so the
+    stages reuse cached data instead of each streaming the whole image from
+    memory. Strips carry _TILE_HALO extra rows on both sides, which gives the
+    morphology the same neighbours it has on the whole image: the result is
+    identical to building the mask in one go.
+    """
+    
+    def __init__(self, shape, tile_rows, to_hsv, build):
+        """
+        Args:
+            shape (tuple): (height, width) of the images to mask
+            tile_rows (int): Mask rows produced per strip
+            to_hsv (bool): Convert each BGR strip to HSV before masking
+            build (callable): build(src, out, tmp) writes the mask of one
+                strip into out, using tmp as scratch
+        """
+        self.height, width = shape
+        self.tile_rows = tile_rows
+        self.build = build
+        rows = min(tile_rows + 2 * _TILE_HALO, self.height)
+        self.hsv = np.empty((rows, width, 3), np.uint8) if to_hsv else None
+        self.out = np.empty((rows, width), np.uint8)
+        self.tmp = np.empty_like(self.out)
+    
+    def __call__(self, img, mask_out):
+        """Write the mask of the BGR (or HSV) image img into mask_out."""
+        for y0 in range(0, self.height, self.tile_rows):
+            y1 = min(y0 + self.tile_rows, self.height)
+            top = max(y0 - _TILE_HALO, 0)
+            bottom = min(y1 + _TILE_HALO, self.height)
+            rows = bottom - top
+            src = img[top:bottom]
+            if self.hsv is not None:
+                src = cv2.cvtColor(src, cv2.COLOR_BGR2HSV, dst=self.hsv[:rows])
+            self.build(src, self.out[:rows], self.tmp[:rows])
+            mask_out[y0:y1] = self.out[y0 - top:y1 - top]
+        return mask_out
 
-    # Clean mask with morphological operations
-    kernel = np.ones((3, 3), np.uint8)
-    mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_OPEN, kernel, iterations=2)
-    mask_total = cv2.morphologyEx(mask_total, cv2.MORPH_DILATE, kernel, iterations=1)
+
+def render_overlay(color, width):
+    """
+    Render the static overlay text once, white on black.
+    
+    Returns (overlay, frame_x, coverage_x): a strip to cv2.max onto the
+    top-left corner of each frame, and the x positions where the per-frame
+    frame number and coverage text continue their lines. Drawing the pieces
+    separately gives the same pixels as drawing the whole strings. With
+    OpenCV 4's aliased text cv2.max reproduces putText exactly; OpenCV 5
+    antialiases text, so edge pixels come out slightly different there.
+    """
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    white = (255, 255, 255)
+    overlay = np.zeros((100, min(400, width), 3), np.uint8)
     
-    return mask_total
+    def advance(prefix, scale, thickness):
+        # Width of prefix up to where the next glyph starts
+        return (cv2.getTextSize(prefix + "0", font, scale, thickness)[0][0]
+                - cv2.getTextSize("0", font, scale, thickness)[0][0])
+    
+    frame_prefix = "Invisible Cloak - Frame "
+    coverage_prefix = "Cloak Coverage: "
+    cv2.putText(overlay, frame_prefix, (10, 30), font, 0.7, white, 2)
+    cv2.putText(overlay, f"Color: {color.upper()}", (10, 60), font, 0.5, white, 1)
+    cv2.putText(overlay, coverage_prefix, (10, 90), font, 0.5, white, 1)
+    return (overlay, 10 + advance(frame_prefix, 0.7, 2),
+            10 + advance(coverage_prefix, 0.5, 1))
+
+
+def _writer_loop(q, params):
+    """Write queued (path, image) pairs to disk until a None sentinel arrives."""
+    while True:
+        item = q.get()
+        if item is None:
+            break
+        path, img = item
+        cv2.imwrite(path, img, params)
 
 
 def main():
@@ -97,29 +237,52 @@ def main():
     os.makedirs(args.output_dir, exist_ok=True)
     
     # Initialize camera
-    cap = cv2.VideoCapture(args.camera)
+    cap = open_camera(args.camera)
     if not cap.isOpened():
         print(f"❌ Cannot open camera {args.camera}")
         return
         
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    mjpeg = configure_camera(cap, 640, 480)
     
-    print(f"📹 Camera {args.camera} initialized")
-    print(f"🎨 Cloak color: {args.color.upper()}")
+    print(f"📹 Camera {args.camera} initialized "
+          f"({'MJPEG' if mjpeg else 'driver default format'})")
+    print(f"🎨 Cloak color: {args.color.upper()} ({args.colorspace.upper()} detection)")
     print(f"📁 Output directory: {args.output_dir}")
 
+    mask_kernel = load_mask_kernel(args.numba)
+    use_numba = mask_kernel is not None
+
+    use_opencl = args.use_opencl and cv2.ocl.haveOpenCL()
+    if args.use_opencl and not use_opencl:
+        print("⚠️ Warning: OpenCL is not available, using the CPU pipeline")
+    elif use_opencl:
+        cv2.ocl.setUseOpenCL(True)
+        print(f"⚡ OpenCL device: {cv2.ocl.Device.getDefault().name()}")
+
+    # JPEG encoding and disk I/O run on a writer thread (imwrite releases the
+    # GIL) so they overlap with capturing the next frame. The bounded queue
+    # applies back-pressure if the disk can't keep up.
+    write_queue = queue.Queue(maxsize=8)
+    # The frames are for visual checks, so a lower-than-default (95) JPEG
+    # quality is fine and encodes noticeably faster
+    jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, args.jpeg_quality, cv2.IMWRITE_JPEG_OPTIMIZE, 0]
+    writer = threading.Thread(target=_writer_loop, args=(write_queue, jpeg_params), daemon=True)
+    writer.start()
+
     try:
         # Step 1: Capture background
         bg = capture_background_nogui(cap, args.bg_frames)
         
         # Save background
         bg_path = os.path.join(args.output_dir, "background.jpg")
-        cv2.imwrite(bg_path, bg)
+        write_queue.put((bg_path, bg))
         print(f"💾 Background saved: {bg_path}")
 
-        # Step 2: Get HSV ranges
-        ranges = get_hsv_ranges(args.color)
+        # Step 2: Get color ranges
+        use_hsv = args.colorspace == "hsv"
+        ranges = get_hsv_ranges(args.color) if use_hsv else get_bgr_ranges(args.color)
+        if use_numba:
+            lows, highs = mask_kernel.pack_ranges(ranges)
 
         print(f"\n🎭 Starting invisible cloak effect...")
         print(f"📸 Capturing {args.demo_frames} demo frames...")
@@ -127,50 +290,149 @@ def main():
         
         time.sleep(3)  # Give user time to get ready
 
+        # Per-frame buffers, allocated once and reused via dst=. Frames are
+        # captured in batches, so the frame-sized inputs hold a whole batch.
+        batch = args.batch_size
+        height, width = bg.shape[:2]
+        small_size = mask_size(width, height, args.mask_scale)
+        small_w, small_h = small_size
+        raw = np.empty_like(bg)
+        frames = np.empty((batch, height, width, 3), np.uint8)
+        if args.mask_scale > 1:
+            smalls = np.empty((batch, small_h, small_w, 3), np.uint8)
+        else:
+            smalls = frames
+        # Strips convert and mask into the tiler's own scratch buffers
+        use_tiles = args.tile_rows > 0 and not use_opencl
+        hsvs = np.empty_like(smalls) if use_hsv and not use_opencl and not use_tiles else None
+        small_masks = np.empty((batch, small_h, small_w), np.uint8)
+        mask_tmp = np.empty_like(small_masks) if not use_tiles else None
+        mask = np.empty((height, width), np.uint8)
+        final = np.empty_like(bg)
+        mask_area = small_w * small_h
+        # With OpenCL the background is uploaded once and stays on the device
+        ubg = cv2.UMat(bg) if use_opencl else None
+        tiler = None
+        if use_tiles:
+            if use_numba:
+                def build_strip(src, out, tmp):
+                    mask_kernel.build_mask_fused(src, lows, highs, out=out, tmp=tmp)
+            else:
+                def build_strip(src, out, tmp):
+                    build_mask(src, ranges, mask_out=out, tmp=tmp)
+            tiler = TiledMaskBuilder((small_h, small_w), args.tile_rows, use_hsv, build_strip)
+        # Static text is rasterized once; only the numbers are drawn per frame
+        overlay, frame_x, coverage_x = render_overlay(args.color, width)
+        overlay_h, overlay_w = overlay.shape[:2]
+        if use_opencl:
+            overlay = cv2.UMat(overlay)
+
         # Step 3: Capture demo frames with cloak effect
-        for frame_num in range(args.demo_frames):
-            ret, frame = cap.read()
-            if not ret:
-                print("❌ Failed to capture frame")
-                break
-
-            # Mirror frame
-            frame = cv2.flip(frame, 1)
-            
-            # Convert to HSV
-            hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-            # Create mask
-            mask = build_mask(hsv, ranges)
-
-            # Apply invisible cloak effect
-            mask_inv = cv2.bitwise_not(mask)
-            cloak_area = cv2.bitwise_and(bg, bg, mask=mask)
-            rest_of_frame = cv2.bitwise_and(frame, frame, mask=mask_inv)
-            final = cv2.addWeighted(cloak_area, 1, rest_of_frame, 1, 0)
-
-            # Add text overlay
-            cv2.putText(final, f"Invisible Cloak - Frame {frame_num+1}", 
-                       (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.putText(final, f"Color: {args.color.upper()}", 
-                       (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            
-            # Calculate cloak coverage
-            coverage = (np.sum(mask > 0) / mask.size) * 100
-            cv2.putText(final, f"Cloak Coverage: {coverage:.1f}%", 
-                       (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-
-            # Save frames
-            original_path = os.path.join(args.output_dir, f"original_{frame_num:03d}.jpg")
-            mask_path = os.path.join(args.output_dir, f"mask_{frame_num:03d}.jpg")
-            result_path = os.path.join(args.output_dir, f"result_{frame_num:03d}.jpg")
-            
-            cv2.imwrite(original_path, frame)
-            cv2.imwrite(mask_path, mask)
-            cv2.imwrite(result_path, final)
-            
-            if (frame_num + 1) % 10 == 0:
-                print(f"📸 Processed {frame_num+1}/{args.demo_frames} frames")
+        frame_num = 0
+        capturing = True
+        while capturing and frame_num < args.demo_frames:
+            # Read and mirror a batch of frames back to back
+            count = 0
+            while count < min(batch, args.demo_frames - frame_num):
+                ret, raw = cap.read(raw)
+                if not ret:
+                    print("❌ Failed to capture frame")
+                    capturing = False
+                    break
+                cv2.flip(raw, 1, dst=frames[count])
+                count += 1
+
+            if not use_opencl and count:
+                # cvtColor and inRange are per-pixel, so the batch runs through
+                # them as one (count*H, W, 3) image; resizing and morphology
+                # look at neighbours and stay per frame
+                if args.mask_scale > 1:
+                    for i in range(count):
+                        cv2.resize(frames[i], small_size, dst=smalls[i],
+                                   interpolation=cv2.INTER_AREA)
+                srcs = smalls
+                if use_hsv and tiler is None:
+                    cv2.cvtColor(smalls[:count].reshape(-1, small_w, 3), cv2.COLOR_BGR2HSV,
+                                 dst=hsvs[:count].reshape(-1, small_w, 3))
+                    srcs = hsvs
+                if not use_numba and tiler is None:
+                    range_mask(srcs[:count].reshape(-1, small_w, 3), ranges,
+                               mask_out=small_masks[:count].reshape(-1, small_w),
+                               tmp=mask_tmp[:count].reshape(-1, small_w))
+
+            for i in range(count):
+                frame = frames[i]
+                if use_opencl:
+                    # Same steps on UMats: the frame is uploaded once and every
+                    # intermediate stays on the OpenCL device
+                    out_final = cv2.UMat(frame)
+                    usmall = out_final
+                    if args.mask_scale > 1:
+                        usmall = cv2.resize(out_final, small_size, interpolation=cv2.INTER_AREA)
+                    if use_hsv:
+                        usmall = cv2.cvtColor(usmall, cv2.COLOR_BGR2HSV)
+                    coverage_mask = build_mask(usmall, ranges)
+                    out_mask = coverage_mask
+                    if args.mask_scale > 1:
+                        out_mask = cv2.resize(coverage_mask, (width, height),
+                                              interpolation=cv2.INTER_NEAREST)
+                    cv2.copyTo(ubg, out_mask, out_final)
+                else:
+                    # Finish the mask at reduced resolution
+                    small_mask = small_masks[i]
+                    if tiler is not None:
+                        # Strips convert and mask the BGR frame themselves
+                        tiler(smalls[i], small_mask)
+                    elif use_numba:
+                        mask_kernel.build_mask_fused(srcs[i], lows, highs,
+                                                     out=small_mask, tmp=mask_tmp[i])
+                    else:
+                        clean_mask(small_mask)
+                    out_mask = small_mask
+                    if args.mask_scale > 1:
+                        cv2.resize(small_mask, (width, height), dst=mask,
+                                   interpolation=cv2.INTER_NEAREST)
+                        out_mask = mask
+
+                    # Apply invisible cloak effect: background over the cloak pixels
+                    # only, in a single masked pass over a copy of the frame
+                    np.copyto(final, frame)
+                    cv2.copyTo(bg, out_mask, final)
+                    out_final, coverage_mask = final, small_mask
+
+                # Add text overlay: blend in the static strip (white text
+                # survives cv2.max, black background leaves the frame alone)
+                if use_opencl:
+                    corner = cv2.UMat(out_final, (0, overlay_h), (0, overlay_w))
+                else:
+                    corner = out_final[:overlay_h, :overlay_w]
+                cv2.max(corner, overlay, dst=corner)
+                cv2.putText(out_final, f"{frame_num+1}", 
+                           (frame_x, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+                
+                # Calculate cloak coverage (the small mask has the same ratio)
+                coverage = cv2.countNonZero(coverage_mask) * (100.0 / mask_area)
+                cv2.putText(out_final, f"{coverage:.1f}%", 
+                           (coverage_x, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+                # Save frames
+                original_path = os.path.join(args.output_dir, f"original_{frame_num:03d}.jpg")
+                mask_path = os.path.join(args.output_dir, f"mask_{frame_num:03d}.jpg")
+                result_path = os.path.join(args.output_dir, f"result_{frame_num:03d}.jpg")
+                
+                # The buffers are reused next batch, so the writer gets copies
+                # (downloading a UMat with get() already makes one)
+                write_queue.put((original_path, frame.copy()))
+                if use_opencl:
+                    write_queue.put((mask_path, out_mask.get()))
+                    write_queue.put((result_path, out_final.get()))
+                else:
+                    write_queue.put((mask_path, out_mask.copy()))
+                    write_queue.put((result_path, final.copy()))
+                
+                frame_num += 1
+                if frame_num % 10 == 0:
+                    print(f"📸 Processed {frame_num}/{args.demo_frames} frames")
 
         print(f"\n🎉 Demo complete!")
         print(f"📁 Check {args.output_dir} folder for:")
@@ -189,6 +451,9 @@ def main():
     finally:
         cap.release()
         print("🧹 Camera released")
+        # Flush the frames still queued for writing
+        write_queue.put(None)
+        writer.join()
 
 
 if __name__ == "__main__":
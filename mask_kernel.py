@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Numba-compiled cloak mask kernel for the Invisible Cloak application.
+
+build_mask_fused() produces exactly the same mask as invisible_cloak.build_mask,
+but tests every HSV range in a single compiled pass and runs the morphology as
+four separable, row-parallel min/max passes. It scales with the number of CPU
+cores; on one or two cores OpenCV's SIMD path is usually faster, which is why
+both applications only use it when asked to (--numba). The kernels release
+the GIL, so they can overlap with other threads such as a frame writer.
+
+Numba is optional. When it is not installed NUMBA_AVAILABLE is False and the
+kernels still run as (slow) plain Python, so callers should keep using the
+OpenCV path in that case.
+
+Requirements: numpy, numba (optional)
+"""
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit that leaves the function uncompiled."""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+
+# build_mask opens with a 5x5 kernel (a 5x5 erosion then a 5x5
+# dilation) and dilates once more with 3x3. Consecutive rectangular
+# dilations merge, so this is a radius-2 erosion followed by a radius-3
+# dilation, each split into a row pass and a column pass.
+_ERODE_RADIUS = 2
+_DILATE_RADIUS = 3
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def _in_range(hsv, lows, highs, out):
+    """Write 255 where a pixel falls inside any of the ranges, else 0."""
+    height, width = out.shape
+    num_ranges = lows.shape[0]
+    for i in prange(height):
+        for j in range(width):
+            h = hsv[i, j, 0]
+            s = hsv[i, j, 1]
+            v = hsv[i, j, 2]
+            hit = False
+            for k in range(num_ranges):
+                hit |= ((lows[k, 0] <= h) & (h <= highs[k, 0])
+                        & (lows[k, 1] <= s) & (s <= highs[k, 1])
+                        & (lows[k, 2] <= v) & (v <= highs[k, 2]))
+            out[i, j] = 255 if hit else 0
+
+
+@njit(nogil=True, cache=True)
+def _combine(a, b, use_max):
+    return max(a, b) if use_max else min(a, b)
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def _row_extremum(src, radius, use_max, out):
+    """Row-wise min (or max) over a window of +/- radius, clipped at the border."""
+    height, width = src.shape
+    for i in prange(height):
+        for j in range(width):
+            out[i, j] = src[i, j]
+        # Fold in each shifted copy of the row; the loops stay contiguous
+        for d in range(1, radius + 1):
+            for j in range(d, width):
+                out[i, j] = _combine(out[i, j], src[i, j - d], use_max)
+            for j in range(width - d):
+                out[i, j] = _combine(out[i, j], src[i, j + d], use_max)
+
+
+@njit(parallel=True, nogil=True, cache=True)
+def _col_extremum(src, radius, use_max, out):
+    """Column-wise min (or max) over a window of +/- radius, clipped at the border."""
+    height, width = src.shape
+    for i in prange(height):
+        for j in range(width):
+            out[i, j] = src[i, j]
+        # Fold in each neighbouring row in the window, a whole row at a time
+        for ii in range(max(i - radius, 0), min(i + radius + 1, height)):
+            for j in range(width):
+                out[i, j] = _combine(out[i, j], src[ii, j], use_max)
+
+
+def pack_ranges(ranges):
+    """
+    Convert a list of (lower, upper) HSV ranges into kernel bound arrays.
+
+    Args:
+        ranges (list): List of (lower, upper) HSV range tuples
+
+    Returns:
+        tuple: (lows, highs) as (N, 3) uint8 arrays
+    """
+    lows = np.array([low for low, _ in ranges], dtype=np.uint8)
+    highs = np.array([high for _, high in ranges], dtype=np.uint8)
+    return lows, highs
+
+
+def build_mask_fused(hsv, lows, highs, out=None, tmp=None):
+    """
+    Build the cleaned cloak mask in compiled passes.
+
+    Args:
+        hsv (numpy.ndarray): HxWx3 uint8 HSV image
+        lows (numpy.ndarray): (N, 3) lower bounds from pack_ranges()
+        highs (numpy.ndarray): (N, 3) upper bounds from pack_ranges()
+        out (numpy.ndarray, optional): Preallocated HxW uint8 buffer for the result
+        tmp (numpy.ndarray, optional): Preallocated HxW uint8 scratch buffer
+
+    Returns:
+        numpy.ndarray: Clean binary mask (``out`` when given)
+    """
+    if out is None:
+        out = np.empty(hsv.shape[:2], np.uint8)
+    if tmp is None:
+        tmp = np.empty_like(out)
+
+    # Range test
+    _in_range(hsv, lows, highs, out)
+
+    # Erosion
+    _row_extremum(out, _ERODE_RADIUS, False, tmp)
+    _col_extremum(tmp, _ERODE_RADIUS, False, out)
+
+    # Dilation
+    _row_extremum(out, _DILATE_RADIUS, True, tmp)
+    _col_extremum(tmp, _DILATE_RADIUS, True, out)
+
+    return out
+
+
+def warmup():
+    """Compile the kernels on a tiny dummy image so the first real frame isn't JIT-cold."""
+    hsv = np.zeros((8, 8, 3), np.uint8)
+    lows, highs = pack_ranges([(np.zeros(3), np.full(3, 255))])
+    build_mask_fused(hsv, lows, highs)
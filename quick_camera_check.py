@@ -5,9 +5,12 @@ Quick Camera Check Script
 Automatically tests cameras and provides solutions for common issues.
 """
 
+import argparse
 import cv2
+import subprocess
 import sys
-import time
+
+from invisible_cloak import scan_cameras
 
 
 def quick_camera_scan():
@@ -15,25 +18,15 @@ def quick_camera_scan():
     print("🔍 Scanning for available cameras...")
     available_cameras = []
     
-    for i in range(6):  # Test cameras 0-5
+    # Test cameras 0-5
+    for i, shape, error in scan_cameras(range(6)):
         print(f"Testing camera {i}...", end=" ")
-        try:
-            cap = cv2.VideoCapture(i)
-            if cap.isOpened():
-                ret, frame = cap.read()
-                if ret and frame is not None:
-                    h, w = frame.shape[:2]
-                    print(f"✅ WORKING ({w}x{h})")
-                    available_cameras.append(i)
-                else:
-                    print("❌ No frame")
-            else:
-                print("❌ Cannot open")
-            cap.release()
-        except Exception as e:
-            print(f"❌ Error: {e}")
-        
-        time.sleep(0.2)
+        if shape is not None:
+            h, w = shape[:2]
+            print(f"✅ WORKING ({w}x{h})")
+            available_cameras.append(i)
+        else:
+            print(f"❌ {error}")
     
     return available_cameras
 
@@ -86,6 +79,11 @@ def test_opencv_installation():
 
 
 def main():
+    ap = argparse.ArgumentParser(description="Quick Camera Diagnostic for Invisible Cloak")
+    ap.add_argument("--spawn", action="store_true",
+                    help="Run the cloak app in a separate Python process")
+    args = ap.parse_args()
+    
     print("=" * 60)
     print("📷 Quick Camera Diagnostic for Invisible Cloak")
     print("=" * 60)
@@ -111,8 +109,16 @@ def main():
         choice = input().strip().lower()
         if choice == 'y':
             print(f"Starting invisible cloak with camera {first_cam}...")
-            import subprocess
-            subprocess.run([sys.executable, "invisible_cloak.py", "--camera", str(first_cam)])
+            argv = ["--camera", str(first_cam)]
+            if args.spawn:
+                subprocess.run([sys.executable, "invisible_cloak.py"] + argv)
+            else:
+                # Run in this process; OpenCV is already imported
+                import invisible_cloak
+                try:
+                    invisible_cloak.main(argv)
+                except RuntimeError as e:
+                    print(f"❌ {e}")
     else:
         print("\n❌ NO WORKING CAMERAS FOUND!")
         show_camera_solutions()
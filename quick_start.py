@@ -5,6 +5,7 @@ Quick start example for the Invisible Cloak application.
 This script demonstrates the simplest way to run the invisible cloak effect.
 """
 
+import argparse
 import subprocess
 import sys
 import os
@@ -21,8 +22,14 @@ def check_dependencies():
         print("Please install dependencies with: pip install -r requirements.txt")
         return False
 
-def run_cloak_app(color='red', camera=0):
-    """Run the invisible cloak application with specified parameters."""
+def run_cloak_app(color='red', camera=0, spawn=False):
+    """
+    Run the invisible cloak application with specified parameters.
+    
+    The app runs in this process, reusing the already-imported OpenCV; with
+    spawn=True it runs as a separate Python process instead, which isolates
+    it from this menu (e.g. for Ctrl-C).
+    """
     if not check_dependencies():
         return False
     
@@ -31,16 +38,20 @@ def run_cloak_app(color='red', camera=0):
     print(f"   Camera: {camera}")
     print(f"   Press 'q' to quit when running")
     
+    argv = ['--color', color, '--camera', str(camera)]
     try:
         # Run the main application
-        cmd = [sys.executable, 'invisible_cloak.py', '--color', color, '--camera', str(camera)]
-        subprocess.run(cmd, check=True)
-    except subprocess.CalledProcessError as e:
+        if spawn:
+            subprocess.run([sys.executable, 'invisible_cloak.py'] + argv, check=True)
+        else:
+            import invisible_cloak
+            invisible_cloak.main(argv)
+    except (subprocess.CalledProcessError, RuntimeError) as e:
         print(f"Error running application: {e}")
         return False
     except KeyboardInterrupt:
         print("\nApplication interrupted by user")
-    except FileNotFoundError:
+    except (FileNotFoundError, ImportError):
         print("Error: invisible_cloak.py not found. Make sure you're in the correct directory.")
         return False
     
@@ -48,6 +59,11 @@ def run_cloak_app(color='red', camera=0):
 
 def main():
     """Main function with interactive menu."""
+    ap = argparse.ArgumentParser(description="Harry Potter Invisible Cloak - Quick Start")
+    ap.add_argument("--spawn", action="store_true",
+                    help="Run the cloak app in a separate Python process")
+    args = ap.parse_args()
+    
     print("=" * 60)
     print("🧙‍♂️ Harry Potter Invisible Cloak - Quick Start")
     print("=" * 60)
@@ -63,9 +79,9 @@ def main():
         choice = input("\nEnter your choice (1-5): ").strip()
         
         if choice == '1':
-            run_cloak_app('red', 0)
+            run_cloak_app('red', 0, spawn=args.spawn)
         elif choice == '2':
-            run_cloak_app('green', 0)
+            run_cloak_app('green', 0, spawn=args.spawn)
         elif choice == '3':
             color = input("Enter cloak color (red/green): ").strip().lower()
             if color not in ['red', 'green']:
@@ -78,7 +94,7 @@ def main():
                 print("Invalid camera ID! Using 0 as default.")
                 camera = 0
             
-            run_cloak_app(color, camera)
+            run_cloak_app(color, camera, spawn=args.spawn)
         elif choice == '4':
             check_dependencies()
         elif choice == '5':
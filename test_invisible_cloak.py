@@ -9,11 +9,30 @@ import numpy as np
 import cv2
 import sys
 import os
+import json
+import tempfile
+from pathlib import Path
 
 # Add the current directory to the path to import invisible_cloak
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from invisible_cloak import get_hsv_ranges, build_mask, parse_args
+import invisible_cloak
+from invisible_cloak import get_hsv_ranges, build_mask, parse_args, _StreamingMedian
+from invisible_cloak_nogui import TiledMaskBuilder, get_bgr_ranges
+from invisible_cloak_nogui import build_mask as build_nogui_mask
+from mask_kernel import build_mask_fused, pack_ranges
+
+
+def _blocky_image(rng):
+    """
+    Blocky random colors with a sprinkle of single-pixel noise, so both the
+    opening and the dilation have something to do (including at the borders).
+    """
+    blocks = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+    image = cv2.resize(blocks, (48, 36), interpolation=cv2.INTER_NEAREST)
+    noise = rng.random(image.shape[:2]) < 0.05
+    image[noise] = rng.integers(0, 256, (int(noise.sum()), 3), dtype=np.uint8)
+    return image
 
 
 def test_color_ranges():
@@ -26,6 +45,9 @@ def test_color_ranges():
     for color in colors_to_test:
         ranges = get_hsv_ranges(color)
         assert len(ranges) >= 1, f"{color} should have at least 1 range"
+        # The bounds are shared, so they must not be writable
+        assert all(not bound.flags.writeable for pair in ranges for bound in pair), \
+            f"{color} bounds should be read-only"
         
         # Red should have 2 ranges due to hue wraparound
         if color == 'red':
@@ -41,13 +63,13 @@ def test_mask_creation():
     print("Testing mask creation...")
     
     # Create a test image with red and green areas
-    test_image = np.zeros((480, 640, 3), dtype=np.uint8)
+    test_image = np.zeros((64, 64, 3), dtype=np.uint8)
     
     # Add a red rectangle
-    test_image[100:200, 100:200] = [0, 0, 255]  # BGR format
+    test_image[10:30, 10:30] = [0, 0, 255]  # BGR format
     
     # Add a green rectangle
-    test_image[300:400, 300:400] = [0, 255, 0]  # BGR format
+    test_image[36:56, 36:56] = [0, 255, 0]  # BGR format
     
     # Convert to HSV
     hsv = cv2.cvtColor(test_image, cv2.COLOR_BGR2HSV)
@@ -57,41 +79,99 @@ def test_mask_creation():
     red_mask = build_mask(hsv, red_ranges)
     
     # Check if red area is detected
-    red_area = np.sum(red_mask[100:200, 100:200] > 0)
-    assert red_area > 1000, f"Red mask detection failed: only {red_area} pixels detected"
+    red_area = np.sum(red_mask[10:30, 10:30] > 0)
+    assert red_area > 100, f"Red mask detection failed: only {red_area} pixels detected"
     
     # Test green cloak detection
     green_ranges = get_hsv_ranges('green')
     green_mask = build_mask(hsv, green_ranges)
     
     # Check if green area is detected
-    green_area = np.sum(green_mask[300:400, 300:400] > 0)
-    assert green_area > 1000, f"Green mask detection failed: only {green_area} pixels detected"
+    green_area = np.sum(green_mask[36:56, 36:56] > 0)
+    assert green_area > 100, f"Green mask detection failed: only {green_area} pixels detected"
     
     print("✓ Mask creation test passed")
 
 
+def test_fused_mask_kernel():
+    """Test that the compiled mask kernel matches the OpenCV mask pipeline."""
+    print("Testing fused mask kernel...")
+    
+    hsv = cv2.cvtColor(_blocky_image(np.random.default_rng(0)), cv2.COLOR_BGR2HSV)
+    
+    for color in ['red', 'green', 'white', 'black']:
+        ranges = get_hsv_ranges(color)
+        expected = build_mask(hsv, ranges)
+        fused = build_mask_fused(hsv, *pack_ranges(ranges))
+        assert np.array_equal(expected, fused), f"Fused kernel mask differs for {color}"
+    
+    print("✓ Fused mask kernel test passed")
+
+
+def test_tiled_mask():
+    """Test that building the mask in strips matches the whole-image mask."""
+    print("Testing tiled mask...")
+    
+    test_image = _blocky_image(np.random.default_rng(2))
+    hsv = cv2.cvtColor(test_image, cv2.COLOR_BGR2HSV)
+    
+    for color in ['red', 'green']:
+        for to_hsv, src, ranges in [(True, hsv, get_hsv_ranges(color)),
+                                    (False, test_image, get_bgr_ranges(color))]:
+            expected = build_nogui_mask(src, ranges)
+            
+            def build(strip, out, tmp):
+                build_nogui_mask(strip, ranges, mask_out=out, tmp=tmp)
+            
+            for tile_rows in [1, 3, 16, 100]:
+                tiler = TiledMaskBuilder(test_image.shape[:2], tile_rows, to_hsv, build)
+                result = tiler(test_image, np.empty(test_image.shape[:2], np.uint8))
+                assert np.array_equal(expected, result), \
+                    f"Tiled mask differs for {color} ({'HSV' if to_hsv else 'BGR'}, {tile_rows} rows)"
+    
+    print("✓ Tiled mask test passed")
+
+
+def test_streaming_median():
+    """Test the histogram background median against np.median."""
+    print("Testing streaming median...")
+    
+    rng = np.random.default_rng(1)
+    frames = rng.integers(0, 256, (9, 8, 10, 3), dtype=np.uint8)
+    # A bright "intruder" passing through a few frames must not show up
+    frames[:3, 2:5, 2:5] = 255
+    
+    median = _StreamingMedian(frames.shape[1:])
+    for frame in frames:
+        median.add(frame)
+    result = median.result().astype(int)
+    expected = np.median(frames, axis=0)
+    
+    # Accurate to within half a 16-level bin
+    assert np.all(np.abs(result - expected) <= 8), "Streaming median is off by more than half a bin"
+    
+    print("✓ Streaming median test passed")
+
+
 def test_cloak_effect():
-    """Test the cloak effect application using bitwise operations."""
+    """Test the cloak effect application using a masked copy."""
     print("Testing cloak effect...")
     
     # Create test images
-    current_frame = np.full((480, 640, 3), 100, dtype=np.uint8)  # Gray frame
-    background = np.full((480, 640, 3), 200, dtype=np.uint8)     # Lighter background
+    current_frame = np.full((64, 64, 3), 100, dtype=np.uint8)  # Gray frame
+    background = np.full((64, 64, 3), 200, dtype=np.uint8)     # Lighter background
     
     # Create a simple mask
-    mask = np.zeros((480, 640), dtype=np.uint8)
-    mask[200:300, 200:300] = 255  # White square in the middle
+    mask = np.zeros((64, 64), dtype=np.uint8)
+    mask[20:40, 20:40] = 255  # White square in the middle
     
     # Apply the same logic as in the main application
-    mask_inv = cv2.bitwise_not(mask)
-    cloak_area = cv2.bitwise_and(background, background, mask=mask)
-    rest_of_frame = cv2.bitwise_and(current_frame, current_frame, mask=mask_inv)
-    result = cv2.addWeighted(cloak_area, 1, rest_of_frame, 1, 0)
+    result = current_frame.copy()
+    cv2.copyTo(background, mask, result)
     
     # Check if the masked area has background values
-    masked_area_value = result[250, 250, 0]  # Center of the mask
-    unmasked_area_value = result[50, 50, 0]   # Outside the mask
+    masked_area_value = result[30, 30, 0]  # Center of the mask
+    unmasked_area_value = result[5, 5, 0]   # Outside the mask
     
     assert masked_area_value == 200, f"Cloak effect failed: masked area value is {masked_area_value}, expected 200"
     assert unmasked_area_value == 100, f"Cloak effect failed: unmasked area value is {unmasked_area_value}, expected 100"
@@ -99,6 +179,47 @@ def test_cloak_effect():
     print("✓ Cloak effect test passed")
 
 
+def test_camera_cache():
+    """Test saving and loading the last-known-good camera."""
+    print("Testing camera cache...")
+    
+    class FakeCapture:
+        def get(self, prop):
+            return cv2.CAP_V4L2 if prop == cv2.CAP_PROP_BACKEND else 0
+    
+    saved_path = invisible_cloak.CAMERA_CACHE
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = Path(tmp) / "cloak" / "camera.json"
+        invisible_cloak.CAMERA_CACHE = cache
+        try:
+            assert invisible_cloak._load_cache() is None, "Missing cache should load as None"
+            
+            invisible_cloak._save_cache(2, FakeCapture())
+            cached = invisible_cloak._load_cache()
+            assert cached is not None, "Saved cache should load"
+            assert cached["index"] == 2 and cached["backend"] == cv2.CAP_V4L2, \
+                f"Cache round trip failed: {cached}"
+            
+            # Another OpenCV version, missing or mistyped keys, and
+            # non-JSON content are all treated as no cache
+            bad_caches = [
+                dict(cached, opencv="0.0.0"),
+                {k: v for k, v in cached.items() if k != "backend"},
+                dict(cached, index="2"),
+                dict(cached, index=True),
+                [cached],
+            ]
+            for bad in bad_caches:
+                cache.write_text(json.dumps(bad))
+                assert invisible_cloak._load_cache() is None, f"Bad cache was accepted: {bad}"
+            cache.write_text("{not json")
+            assert invisible_cloak._load_cache() is None, "Corrupt cache was accepted"
+        finally:
+            invisible_cloak.CAMERA_CACHE = saved_path
+    
+    print("✓ Camera cache test passed")
+
+
 def test_argument_parsing():
     """Test command-line argument parsing."""
     print("Testing argument parsing...")
@@ -123,7 +244,11 @@ def run_all_tests():
     tests = [
         test_color_ranges,
         test_mask_creation,
+        test_fused_mask_kernel,
+        test_tiled_mask,
+        test_streaming_median,
         test_cloak_effect,
+        test_camera_cache,
         test_argument_parsing,
     ]
     